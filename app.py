@@ -1,62 +1,426 @@
 # -*- coding: utf-8 -*-
-import io, json, datetime as dt
+import concurrent.futures
+import dataclasses
+import functools
+import hashlib
+import io, os, tempfile, datetime as dt
+from dataclasses import dataclass, field
 from typing import List
 from pathlib import Path
 
+import orjson
 import streamlit as st
-from pydantic import BaseModel, Field
+from pydantic import TypeAdapter
 
-class Autor(BaseModel):
+@dataclass(slots=True)
+class Autor:
     nome: str = ""
     cargo: str = ""
     email: str = ""
 
-class Relatorio(BaseModel):
+@dataclass(slots=True)
+class Relatorio:
     titulo: str = "Relatório Técnico"
     cliente: str = ""
     projeto: str = ""
     codigo: str = ""
     data: str = dt.date.today().strftime("%Y-%m-%d")
     versao: str = "1.0"
-    autores: List[Autor] = Field(default_factory=lambda: [Autor()])
+    autores: List[Autor] = field(default_factory=lambda: [Autor()])
+    referencias: List[str] = field(default_factory=list)
+    anexos: List[str] = field(default_factory=list)
     resumo_exec: str = ""
     escopo: str = ""
     metodologia: str = ""
     resultados: str = ""
     conclusoes: str = ""
 
-def to_markdown(r: Relatorio) -> str:
-    return f"""# {r.titulo}
-**Cliente:** {r.cliente}  
-**Projeto:** {r.projeto}  
-**Código:** {r.codigo}  
-**Data:** {r.data}  
-**Versão:** {r.versao}
+    def __setattr__(self, name, value):
+        # dirty-bit per campo: o autosave grava apenas o que mudou
+        if hasattr(self, name) and getattr(self, name) != value:
+            st.session_state.setdefault("_dirty", set()).add(name)
+        # object.__setattr__ direto: dataclass(slots=True) recria a classe e
+        # quebra a célula __class__ do super() de zero argumentos
+        object.__setattr__(self, name, value)
 
-## Resumo Executivo
-{r.resumo_exec}
+    def model_dump(self) -> dict:
+        return dataclasses.asdict(self)
 
-## Escopo
-{r.escopo}
+# validação Pydantic fica restrita ao caminho de importação de rascunhos
+_REL_ADAPTER = TypeAdapter(Relatorio)
 
-## Metodologia
-{r.metodologia}
+def load_relatorio(data: dict) -> Relatorio:
+    return _REL_ADAPTER.validate_python(data)
 
-## Resultados
-{r.resultados}
+COUNTER_FILE = Path("counter.json")
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+_EMPTY_MODEL_JSON: bytes = orjson.dumps(
+    Relatorio().model_dump(), option=orjson.OPT_INDENT_2
+)
+DRAFTS_DIR = Path("drafts")
+AUTOSAVE_FILE = DRAFTS_DIR / "autosave.json"
 
-## Conclusões
-{r.conclusoes}
-"""
+def _marca_sujo(campo: str) -> None:
+    st.session_state.setdefault("_dirty", set()).add(campo)
+
+def _redimensiona(lista: list, n: int, fabrica) -> bool:
+    # uma única extensão/fatia em vez de N appends/pops
+    delta = n - len(lista)
+    if delta > 0:
+        lista.extend(fabrica() for _ in range(delta))
+    elif delta < 0:
+        del lista[delta:]
+    return delta != 0
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _draft_json(rel_dict: dict) -> bytes:
+    return orjson.dumps(rel_dict, option=orjson.OPT_INDENT_2)
+
+def autosave(rel_dict: dict) -> None:
+    dirty = st.session_state.get("_dirty")
+    # o merge por campo só é seguro quando o arquivo veio do último flush
+    # desta sessão; caso contrário grava o estado completo
+    sincronizado = "_last_autosave_hash" in st.session_state
+    if sincronizado and not dirty and AUTOSAVE_FILE.exists():
+        return
+    DRAFTS_DIR.mkdir(exist_ok=True)
+    if sincronizado and dirty:
+        try:
+            on_disk = orjson.loads(AUTOSAVE_FILE.read_bytes())
+        except (OSError, ValueError):
+            on_disk = dict(rel_dict)
+        on_disk.update({campo: rel_dict[campo] for campo in dirty})
+    else:
+        on_disk = rel_dict
+    json_bytes = orjson.dumps(on_disk)
+    h = hashlib.blake2b(json_bytes, digest_size=16).digest()
+    if h != st.session_state.get("_last_autosave_hash"):
+        AUTOSAVE_FILE.write_bytes(json_bytes)
+        st.session_state["_last_autosave_hash"] = h
+    st.session_state["_dirty"] = set()
+
+def next_report_code() -> str:
+    if "_counter" not in st.session_state:
+        try:
+            n = int(COUNTER_FILE.read_text().strip() or 0)
+        except (OSError, ValueError):
+            n = 0
+        st.session_state["_counter"] = n
+        st.session_state["_counter_on_disk"] = n
+    st.session_state["_counter"] += 1
+    n = st.session_state["_counter"]
+    if n != st.session_state["_counter_on_disk"]:
+        fd, tmp = tempfile.mkstemp(dir=str(COUNTER_FILE.parent), prefix=".counter-")
+        with os.fdopen(fd, "w") as f:
+            f.write(str(n))
+        os.replace(tmp, COUNTER_FILE)
+        st.session_state["_counter_on_disk"] = n
+    return f"REL-{dt.date.today():%Y}-{n:04d}"
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def to_markdown(rel_dict: dict) -> str:
+    def _gen():
+        yield f"# {rel_dict['titulo']}"
+        # dois espaços finais: quebra de linha dura em Markdown
+        yield f"**Cliente:** {rel_dict['cliente']}  "
+        yield f"**Projeto:** {rel_dict['projeto']}  "
+        yield f"**Código:** {rel_dict['codigo']}  "
+        yield f"**Data:** {rel_dict['data']}  "
+        yield f"**Versão:** {rel_dict['versao']}"
+        yield ""
+        yield "## Autores"
+        vazio = True
+        for a in rel_dict["autores"]:
+            if a["nome"] or a["cargo"] or a["email"]:
+                yield f"- {a['nome']} — {a['cargo']} ({a['email']})"
+                vazio = False
+        if vazio:
+            yield "(preencher)"
+        for titulo, campo in [
+            ("Resumo Executivo", "resumo_exec"),
+            ("Escopo", "escopo"),
+            ("Metodologia", "metodologia"),
+            ("Resultados", "resultados"),
+            ("Conclusões", "conclusoes"),
+        ]:
+            yield ""
+            yield f"## {titulo}"
+            yield rel_dict[campo] or "(preencher)"
+        for titulo, campo in [("Referências", "referencias"), ("Anexos", "anexos")]:
+            yield ""
+            yield f"## {titulo}"
+            vazio = True
+            for item in rel_dict[campo]:
+                if item:
+                    yield f"- {item}"
+                    vazio = False
+            if vazio:
+                yield "(preencher)"
+        yield ""
+
+    return "\n".join(_gen())
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _prepare_logo(raw: bytes, width_cm: float):
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(raw))
+    # ~150 px/cm keeps print quality at the target width
+    target = int(width_cm * 150)
+    img.thumbnail((target, target), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue(), img.size
+
+def get_logo_dims_cm(dims, width_cm: float):
+    w, h = dims
+    return width_cm, width_cm * h / w
+
+@st.cache_data(ttl=10, show_spinner=False)
+def _list_drafts(dir_str: str, dir_mtime: float) -> list:
+    # dir_mtime participa da chave de cache: invalida ao criar/remover arquivos
+    with os.scandir(dir_str) as it:
+        return sorted(e.name for e in it if e.name.endswith(".json"))
+
+@functools.lru_cache(maxsize=1)
+def _pdf_styles():
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    return getSampleStyleSheet()
+
+@functools.lru_cache(maxsize=1)
+def _pdf_spacer():
+    # Spacer é imutável; a mesma instância pode se repetir na story
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Spacer
+
+    return Spacer(1, 0.3 * cm)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_pdf(
+    rel_dict: dict,
+    logo_bytes: bytes = None,
+    logo_dims=None,
+    logo_width_cm: float = 4.0,
+) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Image as RLImage
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=2_000_000, mode="w+b")
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = _pdf_styles()
+    spacer = _pdf_spacer()
+    story = []
+
+    def p(text: str, style: str = "BodyText"):
+        story.append(Paragraph(text, styles[style]))
+        story.append(spacer)
+
+    if logo_bytes and logo_dims:
+        w_cm, h_cm = get_logo_dims_cm(logo_dims, logo_width_cm)
+        story.append(RLImage(io.BytesIO(logo_bytes), width=w_cm * cm, height=h_cm * cm))
+        story.append(spacer)
+    p(rel_dict["titulo"], "Title")
+    p(f"<b>Cliente:</b> {rel_dict['cliente']}")
+    p(f"<b>Projeto:</b> {rel_dict['projeto']}")
+    p(f"<b>Código:</b> {rel_dict['codigo']}")
+    p(f"<b>Data:</b> {rel_dict['data']}")
+    p(f"<b>Versão:</b> {rel_dict['versao']}")
+    for titulo, campo in [
+        ("Resumo Executivo", "resumo_exec"),
+        ("Escopo", "escopo"),
+        ("Metodologia", "metodologia"),
+        ("Resultados", "resultados"),
+        ("Conclusões", "conclusoes"),
+    ]:
+        p(titulo, "Heading2")
+        p(rel_dict[campo] or "(preencher)")
+
+    doc.build(story)
+    with buffer:
+        buffer.seek(0)
+        return buffer.read()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_docx(
+    rel_dict: dict, logo_bytes: bytes = None, logo_width_cm: float = 4.0
+) -> bytes:
+    import gc
+
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        st.warning("Instale lxml para exportar DOCX mais rápido e com menos memória.")
+
+    from docx import Document
+    from docx.shared import Cm
+
+    doc = Document()
+    if logo_bytes:
+        doc.add_picture(io.BytesIO(logo_bytes), width=Cm(logo_width_cm))
+    doc.add_heading(rel_dict["titulo"], level=0)
+    doc.add_paragraph(f"Cliente: {rel_dict['cliente']}")
+    doc.add_paragraph(f"Projeto: {rel_dict['projeto']}")
+    doc.add_paragraph(f"Código: {rel_dict['codigo']}")
+    doc.add_paragraph(f"Data: {rel_dict['data']}")
+    doc.add_paragraph(f"Versão: {rel_dict['versao']}")
+    for titulo, campo in [
+        ("Resumo Executivo", "resumo_exec"),
+        ("Escopo", "escopo"),
+        ("Metodologia", "metodologia"),
+        ("Resultados", "resultados"),
+        ("Conclusões", "conclusoes"),
+    ]:
+        doc.add_heading(titulo, level=1)
+        doc.add_paragraph(rel_dict[campo] or "(preencher)")
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=2_000_000, mode="w+b")
+    doc.save(buffer)
+    # lxml keeps arena memory alive after save in long-running sessions
+    gc.collect()
+    with buffer:
+        buffer.seek(0)
+        return buffer.read()
+
+@st.cache_resource(show_spinner=False)
+def get_drive_creds():
+    from google.oauth2.service_account import Credentials
+
+    info = dict(st.secrets["gcp_service_account"])
+    return Credentials.from_service_account_info(
+        info, scopes=["https://www.googleapis.com/auth/drive"]
+    )
+
+def _new_drive_service(creds=None):
+    from googleapiclient.discovery import build
+
+    return build(
+        "drive",
+        "v3",
+        credentials=creds or get_drive_creds(),
+        cache_discovery=False,
+        static_discovery=True,
+    )
+
+def drive_upload_bytes(service, name: str, data: bytes, mime: str, folder_id: str) -> str:
+    import random, time
+
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaIoBaseUpload
+
+    media = MediaIoBaseUpload(
+        io.BytesIO(data), mimetype=mime, chunksize=1024 * 1024, resumable=True
+    )
+    file_metadata = {"name": name, "parents": [folder_id]}
+    request = service.files().create(
+        body=file_metadata, media_body=media, fields="id, webViewLink"
+    )
+    response = None
+    backoff = 1.0
+    while response is None:
+        try:
+            _status, response = request.next_chunk()
+        except HttpError as e:
+            if e.resp.status in (429, 500, 502, 503, 504) and backoff <= 32:
+                time.sleep(backoff + random.random())
+                backoff *= 2
+            else:
+                raise
+    return response.get("webViewLink", "")
+
+@st.cache_resource(show_spinner=False)
+def _gh_session():
+    import requests
+    from requests.adapters import HTTPAdapter, Retry
+
+    sess = requests.Session()
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["PUT", "GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    sess.mount("https://", adapter)
+    return sess
+
+def github_upload_bytes(name: str, data: bytes, message: str) -> str:
+    import base64
+
+    gh = st.secrets["github"]
+    url = f"https://api.github.com/repos/{gh['repo']}/contents/{gh['base_path']}/{name}"
+    headers = {
+        "Authorization": f"token {gh['token']}",
+        "Accept": "application/vnd.github+json",
+    }
+    sess = _gh_session()
+    r = sess.get(url, headers=headers, params={"ref": gh["branch"]}, timeout=30)
+    sha = r.json()["sha"] if r.status_code == 200 else None
+    # corpo montado como bytes: o base64 nunca vira str nem é re-copiado pelo json.dumps
+    body = (
+        b'{"message":'
+        + orjson.dumps(message)
+        + b',"content":"'
+        + base64.b64encode(data)
+        + b'","branch":'
+        + orjson.dumps(gh["branch"])
+    )
+    if sha:
+        body += b',"sha":' + orjson.dumps(sha)
+    body += b"}"
+    r = sess.put(
+        url,
+        data=body,
+        headers={**headers, "Content-Type": "application/json"},
+        timeout=30,
+    )
+    r.raise_for_status()
+    return r.json()["content"]["html_url"]
 
 st.set_page_config(page_title="Relatório Técnico", page_icon="📝", layout="wide")
 st.title("📝 Formulário de Relatório Técnico")
 
+with st.sidebar:
+    st.header("Logo")
+    logo_file = st.file_uploader("Logo (PNG/JPG)", type=["png", "jpg", "jpeg"])
+    logo_width_cm = st.number_input("Largura do logo (cm)", 1.0, 10.0, 4.0, 0.5)
+    if logo_file is not None:
+        st.session_state.logo_bytes, st.session_state.logo_dims = _prepare_logo(
+            logo_file.getvalue(), logo_width_cm
+        )
+    if st.session_state.get("logo_bytes"):
+        st.image(st.session_state.logo_bytes)
+
+    st.header("Rascunhos")
+    if DRAFTS_DIR.is_dir():
+        nomes = _list_drafts(str(DRAFTS_DIR), os.stat(DRAFTS_DIR).st_mtime)
+    else:
+        nomes = []
+    if nomes:
+        escolha = st.selectbox("Rascunhos salvos", nomes)
+        if st.button("Carregar rascunho"):
+            data = orjson.loads((DRAFTS_DIR / escolha).read_bytes())
+            st.session_state.rel = load_relatorio(data)
+            # o autosave em disco deixou de refletir o estado em memória
+            st.session_state.pop("_last_autosave_hash", None)
+            st.session_state["_dirty"] = set()
+            st.rerun()
+    else:
+        st.caption("Nenhum rascunho salvo ainda.")
+
+logo_bytes = st.session_state.get("logo_bytes")
+logo_dims = st.session_state.get("logo_dims")
+
 if "rel" not in st.session_state:
     st.session_state.rel = Relatorio()
 
 rel: Relatorio = st.session_state.rel
 
+if st.button("Gerar código automático"):
+    rel.codigo = next_report_code()
+
 with st.form("form-relatorio"):
     rel.titulo = st.text_input("Título", value=rel.titulo)
     rel.cliente = st.text_input("Cliente", value=rel.cliente)
@@ -65,6 +429,39 @@ with st.form("form-relatorio"):
     rel.data = st.date_input("Data", value=dt.date.fromisoformat(rel.data)).isoformat()
     rel.versao = st.text_input("Versão", value=rel.versao)
 
+    st.markdown("**Autores**")
+    n_aut = int(st.number_input("Número de autores", 1, 20, len(rel.autores)))
+    if _redimensiona(rel.autores, n_aut, Autor):
+        _marca_sujo("autores")
+    for i, a in enumerate(rel.autores):
+        cols = st.columns(3)
+        nome = cols[0].text_input(f"Nome do autor {i + 1}", value=a.nome)
+        cargo = cols[1].text_input(f"Cargo do autor {i + 1}", value=a.cargo)
+        email = cols[2].text_input(f"E-mail do autor {i + 1}", value=a.email)
+        if (nome, cargo, email) != (a.nome, a.cargo, a.email):
+            a.nome, a.cargo, a.email = nome, cargo, email
+            _marca_sujo("autores")
+
+    st.markdown("**Referências**")
+    n_ref = int(st.number_input("Número de referências", 0, 50, len(rel.referencias)))
+    if _redimensiona(rel.referencias, n_ref, str):
+        _marca_sujo("referencias")
+    for i in range(len(rel.referencias)):
+        ref = st.text_input(f"Referência {i + 1}", value=rel.referencias[i])
+        if ref != rel.referencias[i]:
+            rel.referencias[i] = ref
+            _marca_sujo("referencias")
+
+    st.markdown("**Anexos**")
+    n_anx = int(st.number_input("Número de anexos", 0, 50, len(rel.anexos)))
+    if _redimensiona(rel.anexos, n_anx, str):
+        _marca_sujo("anexos")
+    for i in range(len(rel.anexos)):
+        anx = st.text_input(f"Anexo {i + 1}", value=rel.anexos[i])
+        if anx != rel.anexos[i]:
+            rel.anexos[i] = anx
+            _marca_sujo("anexos")
+
     rel.resumo_exec = st.text_area("Resumo Executivo", value=rel.resumo_exec)
     rel.escopo = st.text_area("Escopo", value=rel.escopo)
     rel.metodologia = st.text_area("Metodologia", value=rel.metodologia)
@@ -74,6 +471,102 @@ with st.form("form-relatorio"):
     submitted = st.form_submit_button("Atualizar prévia")
     if submitted:
         st.session_state.rel = rel
+        autosave(rel.model_dump())
+
+rel_dict = rel.model_dump()
+md = to_markdown(rel_dict)
+
+with st.expander("Prévia (Markdown)", expanded=False):
+    # st.text evita a tokenização Pygments do st.code a cada rerun
+    st.text(md)
+
+st.subheader("Exportar")
+col_md, col_pdf, col_docx = st.columns(3)
+with col_md:
+    st.download_button(
+        "Baixar Markdown",
+        data=md.encode("utf-8"),
+        file_name="relatorio.md",
+        mime="text/markdown",
+    )
+with col_pdf:
+    if st.button("Gerar PDF"):
+        st.session_state.pdf_bytes = build_pdf(rel_dict, logo_bytes, logo_dims, logo_width_cm)
+    if st.session_state.get("pdf_bytes"):
+        st.download_button(
+            "Baixar PDF",
+            data=st.session_state.pdf_bytes,
+            file_name="relatorio.pdf",
+            mime="application/pdf",
+        )
+with col_docx:
+    if st.button("Gerar DOCX"):
+        st.session_state.docx_bytes = build_docx(rel_dict, logo_bytes, logo_width_cm)
+    if st.session_state.get("docx_bytes"):
+        st.download_button(
+            "Baixar DOCX",
+            data=st.session_state.docx_bytes,
+            file_name="relatorio.docx",
+            mime=DOCX_MIME,
+        )
+
+st.subheader("Rascunho (JSON)")
+col_rasc, col_modelo = st.columns(2)
+with col_rasc:
+    st.download_button(
+        "Baixar rascunho (JSON)",
+        data=_draft_json(rel_dict),
+        file_name="rascunho_relatorio.json",
+        mime="application/json",
+    )
+with col_modelo:
+    st.download_button(
+        "Baixar modelo (JSON)",
+        data=_EMPTY_MODEL_JSON,
+        file_name="modelo_relatorio.json",
+        mime="application/json",
+    )
+
+st.subheader("Enviar ao Drive")
+if st.button("Enviar exportações (MD/PDF/DOCX) ao Drive"):
+    folder_id = st.secrets["drive"]["folder_id"]
+    creds = get_drive_creds()
+    arquivos = [
+        ("relatorio.md", md.encode("utf-8"), "text/markdown"),
+        ("relatorio.pdf", build_pdf(rel_dict, logo_bytes, logo_dims, logo_width_cm), "application/pdf"),
+        ("relatorio.docx", build_docx(rel_dict, logo_bytes, logo_width_cm), DOCX_MIME),
+    ]
+
+    def _upload(name: str, data: bytes, mime: str):
+        # googleapiclient http objects are not thread-safe: one service per thread
+        service = _new_drive_service(creds)
+        return name, drive_upload_bytes(service, name, data, mime, folder_id)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as ex:
+        futures = [ex.submit(_upload, *arq) for arq in arquivos]
+        for fut in concurrent.futures.as_completed(futures):
+            try:
+                name, link = fut.result()
+                st.success(f"✅ {name}: {link}")
+            except Exception as e:
+                st.error(f"Falha no envio ao Drive: {e}")
+
+st.subheader("Enviar ao GitHub")
+if st.button("Enviar exportações (MD/PDF/DOCX) ao GitHub"):
+    arquivos = [
+        ("relatorio.md", md.encode("utf-8")),
+        ("relatorio.pdf", build_pdf(rel_dict, logo_bytes, logo_dims, logo_width_cm)),
+        ("relatorio.docx", build_docx(rel_dict, logo_bytes, logo_width_cm)),
+    ]
+
+    def _gh_upload(name: str, data: bytes):
+        return name, github_upload_bytes(name, data, f"Atualiza {name}")
 
-st.subheader("Prévia (Markdown)")
-st.code(to_markdown(rel), language="markdown")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as ex:
+        futures = [ex.submit(_gh_upload, *arq) for arq in arquivos]
+        for fut in concurrent.futures.as_completed(futures):
+            try:
+                name, link = fut.result()
+                st.success(f"✅ {name}: {link}")
+            except Exception as e:
+                st.error(f"Falha no envio ao GitHub: {e}")